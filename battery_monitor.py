@@ -6,15 +6,40 @@ Handles monitoring of battery level and charging status.
 
 import logging
 import time
+from array import array
 import RPi.GPIO as GPIO
+from smbus2 import SMBus
 from pathlib import Path
 
+from gpio_manager import setup_input, cleanup_pins
+
 logger = logging.getLogger(__name__)
 
+# ADS1115 register pointers
+ADS1115_CONVERSION_REG = 0x00
+ADS1115_CONFIG_REG = 0x01
+
+# Single-shot conversion, +/-4.096 V range, 860 SPS, comparator disabled
+ADS1115_CONFIG_BASE = 0x8000 | (0b001 << 9) | (1 << 8) | (0b111 << 5) | 0b11
+
+# Samples per burst; must stay a power of two for the shift average
+BURST_SHIFT = 4
+BURST_SAMPLES = 1 << BURST_SHIFT
+
+# One conversion period at 860 SPS, and the status polls allowed per conversion
+CONVERSION_TIME = 1 / 860
+CONVERSION_MAX_POLLS = 10
+
+# Seconds a converted battery level is reused before sampling again
+LEVEL_CACHE_TIME = 30.0
+
+# Minimum seconds between two logged hardware read errors
+ERROR_LOG_INTERVAL = 1.0
+
 class BatteryMonitor:
     """
     Class for monitoring battery status and level.
-    Implements hardware abstraction for different UPS HAT models.
+    Reads the battery voltage from an ADS1115 ADC over I2C.
     """
     
     def __init__(self, config):
@@ -26,28 +51,34 @@ class BatteryMonitor:
         """
         self.config = config
         self.battery_level = 100  # Default to 100% if monitoring fails
-        self.is_charging = False
+        self._charging = False
+        self.bus = None
+        self.charging_pin = 26  # Example pin, adjust based on your hardware
+        self.last_level_time = None
+        self.last_error_time = 0
+        self.samples = array('h', [0] * BURST_SAMPLES)
+        
+        adc_settings = config['battery_adc']
+        self.adc_address = adc_settings['i2c_address']
+        self.adc_config = ADS1115_CONFIG_BASE | ((0b100 | adc_settings['channel']) << 12)
+        self.min_value = adc_settings['min_value']
+        self._scale = 100 / (adc_settings['max_value'] - self.min_value)
+        
         self.initialize_monitor()
         
     def initialize_monitor(self):
         """Initialize battery monitoring hardware."""
         try:
-            # Configure GPIO for battery monitoring
-            GPIO.setmode(GPIO.BCM)
-            
-            # Setup battery level monitoring pins
-            # Note: These pin numbers should be configured based on your specific UPS HAT
-            self.battery_pin = 25  # Example pin, adjust based on your hardware
-            GPIO.setup(self.battery_pin, GPIO.IN)
+            # Open I2C bus to the battery ADC
+            self.bus = SMBus(self.config['battery_adc']['i2c_bus'])
             
             # Setup charging status monitoring
-            self.charging_pin = 26  # Example pin, adjust based on your hardware
-            GPIO.setup(self.charging_pin, GPIO.IN)
+            setup_input(self.charging_pin)
             
             logger.info("Battery monitor initialized successfully")
             
         except Exception as e:
-            logger.error(f"Failed to initialize battery monitor: {e}")
+            logger.error("Failed to initialize battery monitor: %s", e)
             
     def get_level(self):
         """
@@ -56,21 +87,24 @@ class BatteryMonitor:
         Returns:
             int: Battery level percentage (0-100)
         """
-        try:
-            # Read battery level from hardware
-            # This is a simplified example - actual implementation will depend on your UPS HAT
-            raw_value = GPIO.input(self.battery_pin)
-            
-            # Convert raw value to percentage
-            # This conversion will need to be calibrated for your specific hardware
-            self.battery_level = self._convert_to_percentage(raw_value)
-            
+        now = time.monotonic()
+        if self.last_level_time is not None and now - self.last_level_time < LEVEL_CACHE_TIME:
             return self.battery_level
             
+        # Average a short burst of conversions to cut ADC noise
+        try:
+            total = self._read_burst()
         except Exception as e:
-            logger.error(f"Error reading battery level: {e}")
+            self._log_error("Error reading battery level: %s", e)
             return self.battery_level  # Return last known value
             
+        # Convert raw value to percentage
+        # This conversion will need to be calibrated for your specific hardware
+        self.battery_level = self._convert_to_percentage(total >> BURST_SHIFT)
+        self.last_level_time = now
+        
+        return self.battery_level
+            
     def is_charging(self):
         """
         Check if battery is currently charging.
@@ -79,17 +113,57 @@ class BatteryMonitor:
             bool: True if charging, False otherwise
         """
         try:
-            self.is_charging = bool(GPIO.input(self.charging_pin))
-            return self.is_charging
-            
+            level = GPIO.input(self.charging_pin)
         except Exception as e:
-            logger.error(f"Error checking charging status: {e}")
-            return self.is_charging  # Return last known value
+            self._log_error("Error checking charging status: %s", e)
+            return self._charging  # Return last known value
             
+        self._charging = bool(level)
+        return self._charging
+        
+    def _log_error(self, message, *args):
+        """
+        Log a hardware read error, at most once per ERROR_LOG_INTERVAL.
+        
+        Args:
+            message (str): Error message format string
+            *args: Arguments for the message format string
+        """
+        now = time.monotonic()
+        if now - self.last_error_time >= ERROR_LOG_INTERVAL:
+            self.last_error_time = now
+            logger.error(message, *args)
+            
+    def _read_burst(self):
+        """
+        Run back-to-back single-shot conversions into the sample buffer.
+        
+        Returns:
+            int: Sum of all samples in the burst
+        """
+        config_bytes = [self.adc_config >> 8, self.adc_config & 0xFF]
+        
+        for i in range(BURST_SAMPLES):
+            self.bus.write_i2c_block_data(self.adc_address, ADS1115_CONFIG_REG, config_bytes)
+            
+            # Wait for the OS bit to signal the end of the conversion
+            for _ in range(CONVERSION_MAX_POLLS):
+                time.sleep(CONVERSION_TIME)
+                if self.bus.read_i2c_block_data(self.adc_address, ADS1115_CONFIG_REG, 2)[0] & 0x80:
+                    break
+            else:
+                raise TimeoutError(f"ADS1115 at 0x{self.adc_address:02x} did not finish a conversion")
+                
+            high, low = self.bus.read_i2c_block_data(self.adc_address, ADS1115_CONVERSION_REG, 2)
+            value = (high << 8) | low
+            self.samples[i] = value - 0x10000 if value & 0x8000 else value
+            
+        return sum(self.samples)
+        
     def _convert_to_percentage(self, raw_value):
         """
         Convert raw ADC value to battery percentage.
-        This method should be calibrated for your specific hardware.
+        The min_value/max_value calibration comes from the battery_adc settings.
         
         Args:
             raw_value (int): Raw value from ADC
@@ -97,22 +171,17 @@ class BatteryMonitor:
         Returns:
             int: Battery percentage (0-100)
         """
-        # Example conversion - adjust based on your hardware specifications
-        # This is a placeholder - actual conversion will depend on your UPS HAT
-        min_value = 0
-        max_value = 1023  # Typical for 10-bit ADC
-        
-        percentage = ((raw_value - min_value) / (max_value - min_value)) * 100
+        percentage = (raw_value - self.min_value) * self._scale
         return max(0, min(100, int(percentage)))
         
     def cleanup(self):
         """Clean up GPIO resources."""
         try:
-            GPIO.cleanup()
+            if self.bus:
+                self.bus.close()
+                self.bus = None
+                
+            cleanup_pins([self.charging_pin])
             logger.info("Battery monitor GPIO resources cleaned up")
         except Exception as e:
-            logger.error(f"Error cleaning up battery monitor: {e}")
-            
-    def __del__(self):
-        """Destructor to ensure proper cleanup."""
-        self.cleanup() 
\ No newline at end of file
+            logger.error("Error cleaning up battery monitor: %s", e) 
\ No newline at end of file
@@ -5,16 +5,26 @@ Handles physical button inputs with proper debouncing and event handling.
 """
 
 import logging
-import time
-import RPi.GPIO as GPIO
+from datetime import timedelta
 from threading import Thread, Event
 
+import gpiod
+from gpiod.line import Bias, Direction, Edge
+
+from gpio_manager import GPIO_CHIP
+
 logger = logging.getLogger(__name__)
 
+# Kernel debounce period applied to every button line
+DEBOUNCE_PERIOD = timedelta(milliseconds=50)
+
+# How long the event thread blocks before re-checking the stop flag
+EVENT_WAIT_TIMEOUT = timedelta(milliseconds=500)
+
 class ButtonController:
     """
     Class for handling physical button inputs.
-    Implements hardware and software debouncing.
+    Uses libgpiod edge events with kernel debouncing and timestamps.
     """
     
     def __init__(self, config):
@@ -26,70 +36,125 @@ class ButtonController:
         """
         self.config = config
         self.buttons = {}
-        self.button_states = {}
-        self.last_press_times = {}
         self.callbacks = {}
+        
+        # Per-button state as parallel lists indexed by button position
+        self._pin_to_idx = {}
+        self._name_to_idx = {}
+        self._states = []
+        self._last_ns = []
+        self._callbacks = []
+        self.request = None
+        self.event_thread = None
         self.stop_event = Event()
+        self._debounce_ns = int(config['player_settings']['button_debounce_time'] * 1_000_000_000)
         self.initialize_buttons()
         
     def initialize_buttons(self):
-        """Initialize all buttons with proper GPIO configuration."""
+        """Request all button lines and start the edge event thread."""
         try:
-            # Set GPIO mode
-            GPIO.setmode(GPIO.BCM)
+            settings = gpiod.LineSettings(
+                direction=Direction.INPUT,
+                bias=Bias.PULL_UP,
+                edge_detection=Edge.BOTH,
+                debounce_period=DEBOUNCE_PERIOD
+            )
             
-            # Configure each button
-            for button_name, pin in self.config['gpio_pins'].items():
-                # Setup GPIO pin with pull-up resistor
-                GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-                
-                # Store button configuration
+            # Store button configuration
+            for idx, (button_name, pin) in enumerate(self.config['gpio_pins'].items()):
                 self.buttons[button_name] = pin
-                self.button_states[button_name] = True  # True = not pressed (pull-up)
-                self.last_press_times[button_name] = 0
+                self._pin_to_idx[pin] = idx
+                self._name_to_idx[button_name] = idx
+                self._states.append(True)  # True = not pressed (pull-up)
+                self._last_ns.append(0)
+                self._callbacks.append(self.callbacks.get(button_name))
                 
-                # Add event detection
-                GPIO.add_event_detect(
-                    pin,
-                    GPIO.BOTH,
-                    callback=lambda x, b=button_name: self._button_callback(b),
-                    bouncetime=300  # Hardware debouncing
-                )
+            # Request all button lines at once
+            self.request = gpiod.request_lines(
+                GPIO_CHIP,
+                consumer='media_player_buttons',
+                config={tuple(self._pin_to_idx): settings}
+            )
+            
+            # Dispatch edge events from a single daemon thread
+            self.event_thread = Thread(target=self._event_loop, daemon=True)
+            self.event_thread.start()
                 
             logger.info("Buttons initialized successfully")
             
         except Exception as e:
-            logger.error(f"Failed to initialize buttons: {e}")
+            logger.error("Failed to initialize buttons: %s", e)
             
-    def _button_callback(self, button_name):
+    def _event_loop(self):
+        """Wait for edge events and dispatch them until stopped."""
+        # Resolve bound methods once, every edge goes through the same dispatcher
+        wait_edge_events = self.request.wait_edge_events
+        read_edge_events = self.request.read_edge_events
+        dispatch = self._dispatch_event
+        
+        while not self.stop_event.is_set():
+            try:
+                if not wait_edge_events(EVENT_WAIT_TIMEOUT):
+                    continue
+                    
+                for event in read_edge_events():
+                    dispatch(event)
+                    
+            except Exception as e:
+                logger.error("Error in button event loop: %s", e)
+                
+    def _dispatch_event(self, event):
         """
-        Handle button press/release events with software debouncing.
+        Route an edge to the press or release handler by its direction.
         
         Args:
-            button_name (str): Name of the button that triggered the event
+            event (gpiod.EdgeEvent): Edge event read from the line request
         """
-        try:
-            current_time = time.time()
-            pin = self.buttons[button_name]
+        idx = self._pin_to_idx[event.line_offset]
+        
+        # Buttons are active low: falling edge = press, rising edge = release
+        if event.event_type is gpiod.EdgeEvent.Type.FALLING_EDGE:
+            self._on_press(idx, event.timestamp_ns)
+        else:
+            self._on_release(idx)
             
-            # Software debouncing
-            if current_time - self.last_press_times[button_name] < self.config['player_settings']['button_debounce_time']:
-                return
-                
-            # Read current state
-            current_state = GPIO.input(pin)
+    def _on_press(self, idx, now):
+        """
+        Handle a button press.
+        
+        Args:
+            idx (int): Button index
+            now (int): Kernel timestamp of the edge in nanoseconds
+        """
+        # Repeat suppression on the kernel timestamp, no clock read needed
+        if now - self._last_ns[idx] < self._debounce_ns:
+            return
             
-            # Only trigger on state change
-            if current_state != self.button_states[button_name]:
-                self.button_states[button_name] = current_state
-                self.last_press_times[button_name] = current_time
-                
-                # Call registered callback if exists
-                if button_name in self.callbacks:
-                    self.callbacks[button_name](current_state)
-                    
-        except Exception as e:
-            logger.error(f"Error in button callback: {e}")
+        self._last_ns[idx] = now
+        self._states[idx] = False
+        
+        # Call registered callback if exists
+        callback = self._callbacks[idx]
+        if callback:
+            callback(False)
+            
+    def _on_release(self, idx):
+        """
+        Handle a button release.
+        
+        Args:
+            idx (int): Button index
+        """
+        # Release of a suppressed press
+        if self._states[idx]:
+            return
+            
+        self._states[idx] = True
+        
+        # Call registered callback if exists
+        callback = self._callbacks[idx]
+        if callback:
+            callback(True)
             
     def register_callback(self, button_name, callback):
         """
@@ -100,7 +165,10 @@ class ButtonController:
             callback (function): Function to call when button state changes
         """
         self.callbacks[button_name] = callback
-        logger.info(f"Callback registered for button: {button_name}")
+        idx = self._name_to_idx.get(button_name)
+        if idx is not None:
+            self._callbacks[idx] = callback
+        logger.info("Callback registered for button: %s", button_name)
         
     def get_button_state(self, button_name):
         """
@@ -112,26 +180,22 @@ class ButtonController:
         Returns:
             bool: True if button is not pressed, False if pressed
         """
-        try:
-            return self.button_states.get(button_name, True)
-        except Exception as e:
-            logger.error(f"Error getting button state: {e}")
-            return True
+        idx = self._name_to_idx.get(button_name)
+        return True if idx is None else self._states[idx]
             
     def cleanup(self):
-        """Clean up GPIO resources."""
+        """Stop the event thread and release the button lines."""
         try:
-            # Remove event detection
-            for pin in self.buttons.values():
-                GPIO.remove_event_detect(pin)
+            self.stop_event.set()
+            if self.event_thread:
+                self.event_thread.join()
+                
+            # Release line request
+            if self.request:
+                self.request.release()
+                self.request = None
                 
-            # Clean up GPIO
-            GPIO.cleanup()
             logger.info("Button controller GPIO resources cleaned up")
             
         except Exception as e:
-            logger.error(f"Error cleaning up button controller: {e}")
-            
-    def __del__(self):
-        """Destructor to ensure proper cleanup."""
-        self.cleanup() 
\ No newline at end of file
+            logger.error("Error cleaning up button controller: %s", e)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+GPIO Manager Module
+Owns RPi.GPIO mode selection and pin cleanup shared by all components.
+"""
+
+import atexit
+import logging
+import RPi.GPIO as GPIO
+
+logger = logging.getLogger(__name__)
+
+# GPIO character device of the 40-pin header on the Raspberry Pi 5
+GPIO_CHIP = '/dev/gpiochip4'
+
+_setup_done = False
+_claimed_pins = set()
+
+def ensure_mode():
+    """
+    Select BCM numbering unless a numbering mode is already set.
+    Must run before libraries that pick their own mode when none is set,
+    such as mfrc522, which would otherwise select BOARD numbering.
+    """
+    global _setup_done
+    if not _setup_done:
+        if GPIO.getmode() is None:
+            GPIO.setmode(GPIO.BCM)
+        atexit.register(cleanup_pins, _claimed_pins)
+        _setup_done = True
+        
+def setup_input(pin, pull=GPIO.PUD_OFF):
+    """
+    Configure a pin as input, selecting BCM numbering on first use.
+    
+    Args:
+        pin (int): BCM pin number
+        pull (int): GPIO.PUD_UP, GPIO.PUD_DOWN or GPIO.PUD_OFF
+    """
+    ensure_mode()
+    if GPIO.getmode() != GPIO.BCM:
+        raise RuntimeError("GPIO numbering mode is not BCM")
+        
+    GPIO.setup(pin, GPIO.IN, pull_up_down=pull)
+    _claimed_pins.add(pin)
+    
+def cleanup_pins(pins):
+    """
+    Release only the given pins, leaving pins owned by other components alone.
+    
+    Args:
+        pins (iterable): BCM pin numbers previously set up with setup_input
+    """
+    pins = [pin for pin in pins if pin in _claimed_pins]
+    if not pins:
+        return
+        
+    try:
+        GPIO.cleanup(pins)
+        _claimed_pins.difference_update(pins)
+        logger.info("GPIO pins cleaned up: %s", pins)
+    except Exception as e:
+        logger.error("Error cleaning up GPIO pins %s: %s", pins, e)
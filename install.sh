@@ -224,6 +224,10 @@ EOF
 print_status "Setting up permissions..."
 usermod -a -G video,gpio,i2c,spi $USER
 
+# Allow the service user to shut down without a password
+echo "$USER ALL=(root) NOPASSWD: /sbin/shutdown" > /etc/sudoers.d/$SERVICE_NAME
+chmod 440 /etc/sudoers.d/$SERVICE_NAME
+
 # Reboot prompt
 print_status "Installation complete!"
 print_warning "The system needs to reboot to apply all changes."
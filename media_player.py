@@ -4,14 +4,19 @@ Raspberry Pi 5 RFID-Activated Media Player
 Main application file containing core functionality and initialization.
 """
 
+import atexit
 import os
-import json
 import logging
+import logging.handlers
+import pickle
+import queue
+import subprocess
 import threading
 import time
 from datetime import datetime
 from pathlib import Path
 
+import orjson
 import kivy
 from kivy.app import App
 from kivy.core.window import Window
@@ -30,45 +35,114 @@ from rfid_reader import RFIDReader
 from battery_monitor import BatteryMonitor
 from button_controller import ButtonController
 from video_player import VideoPlayer
+from gpio_manager import setup_input, cleanup_pins
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('media_player.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging; records are queued and written by a listener thread
+# so file and console I/O never block the Kivy main thread
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+log_handlers = [
+    logging.FileHandler('media_player.log'),
+    logging.StreamHandler()
+]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+    
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# The listener's handlers format the record; keep the queued message bare
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
 logger = logging.getLogger(__name__)
 
+# Non-interactive sudo so a missing sudoers rule fails instead of prompting
+SHUTDOWN_COMMAND = ['sudo', '-n', '/sbin/shutdown', '-h', 'now']
+
+# Parsed configuration is cached next to config.json and reused until it changes
+CONFIG_FILE = Path('config.json')
+CONFIG_CACHE_FILE = Path('config.json.cache.pkl')
+
 class MediaPlayerApp(App):
     """
     Main application class for the RFID-activated media player.
     Handles initialization, UI components, and core functionality.
     """
     
+    # Playback progress in percent, bound to the progress bar
+    progress = NumericProperty(0)
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.config = self.load_config()
+        self._tag_map = {t['tag_id']: t['video_path'] for t in self.config['rfid_tags']}
+        
+        # Settings read on every tick, resolved once
+        player_settings = self.config['player_settings']
+        self._crit = player_settings['critical_battery_threshold']
+        self._low = player_settings['low_battery_threshold']
+        self._scan_interval = player_settings['scan_interval']
+        
         self.rfid_reader = None
+        self.rfid_thread = None
+        self.rfid_stop_event = threading.Event()
         self.battery_monitor = None
         self.button_controller = None
         self.video_player = None
         self.current_video = None
+        self._duration = 0
+        self._win_width_inv = 0
         self.is_test_mode = False
         self.controls_visible = False
         self.last_touch_time = 0
+        self._progress_from_player = False
         self.controls_timeout = 3.0  # Controls hide after 3 seconds
+        self.power_button_pin = 3  # GPIO pin for power button
         
     def load_config(self):
-        """Load configuration from JSON file."""
+        """Load configuration from JSON file, using the pickle cache when it is current."""
         try:
-            with open('config.json', 'r') as f:
-                return json.load(f)
+            stat = CONFIG_FILE.stat()
+            config_key = (stat.st_mtime_ns, stat.st_size)
+            config = self._load_cached_config(config_key)
+            if config is not None:
+                return config
+                
+            config = orjson.loads(CONFIG_FILE.read_bytes())
         except Exception as e:
-            logger.error(f"Failed to load configuration: {e}")
+            logger.error("Failed to load configuration: %s", e)
             raise
+            
+        try:
+            with open(CONFIG_CACHE_FILE, 'wb') as f:
+                pickle.dump((config_key, config), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.warning("Failed to write configuration cache: %s", e)
+            
+        return config
+
+    def _load_cached_config(self, config_key):
+        """
+        Return the cached configuration if it was built from this config.json.
+        
+        Args:
+            config_key (tuple): (st_mtime_ns, st_size) of config.json
+            
+        Returns:
+            dict: Cached configuration, or None if missing or stale
+        """
+        try:
+            with open(CONFIG_CACHE_FILE, 'rb') as f:
+                cached_key, config = pickle.load(f)
+            if cached_key == config_key:
+                return config
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Ignoring unreadable configuration cache: %s", e)
+        return None
 
     def build(self):
         """Build the application UI."""
@@ -96,6 +170,7 @@ class MediaPlayerApp(App):
         # Add progress bar
         self.progress_bar = Slider(min=0, max=100, value=0)
         self.progress_bar.bind(value=self.on_progress_change)
+        self.bind(progress=self.progress_bar.setter('value'))
         self.controls_overlay.add_widget(self.progress_bar)
         
         # Add status label
@@ -114,6 +189,10 @@ class MediaPlayerApp(App):
         Window.bind(on_touch_down=self.on_touch_down)
         Window.bind(on_touch_up=self.on_touch_up)
         
+        # Track window width for touch position scaling
+        self._win_width_inv = 1.0 / Window.width
+        Window.bind(on_resize=self.on_window_resize)
+        
         return self.root
 
     def initialize_components(self):
@@ -130,105 +209,141 @@ class MediaPlayerApp(App):
             
             # Initialize video player
             self.video_player = VideoPlayer(self.config)
+            self.video_player.on_playback_error = (
+                lambda text: Clock.schedule_once(lambda dt: self.show_message(text))
+            )
             
             logger.info("All components initialized successfully")
             
         except Exception as e:
-            logger.error(f"Failed to initialize components: {e}")
+            logger.error("Failed to initialize components: %s", e)
             raise
 
     def start_background_tasks(self):
         """Start background monitoring tasks."""
-        # Start RFID scanning
-        Clock.schedule_interval(self.scan_rfid, 
-                              self.config['player_settings']['scan_interval'])
+        # Start RFID scanning off the UI thread
+        self.rfid_thread = threading.Thread(target=self._rfid_worker, daemon=True)
+        self.rfid_thread.start()
+        
+        # Start progress and controls timeout updates
+        Clock.schedule_interval(self.update_progress, 1.0)
         
         # Start battery monitoring
         Clock.schedule_interval(self.check_battery, 60)  # Check every minute
         
-        # Start resource optimization
-        Clock.schedule_interval(self.optimize_resources, 300)  # Check every 5 minutes
-        
         # Initialize system event handlers
         self.handle_system_events()
         
         logger.info("Background tasks started")
 
-    def scan_rfid(self, dt):
-        """Scan for RFID tags and handle detection."""
-        if self.is_test_mode:
-            return
-            
-        try:
-            tag_id = self.rfid_reader.read_tag()
-            if tag_id:
-                self.handle_tag_detection(tag_id)
-        except Exception as e:
-            logger.error(f"RFID scanning error: {e}")
+    def _rfid_worker(self):
+        """Scan for RFID tags and hand detections to the UI thread."""
+        scan_interval = self._scan_interval
+        timeout_ms = int(scan_interval * 1000)
+        stop_event = self.rfid_stop_event
+        while not stop_event.is_set():
+            try:
+                if self.rfid_reader.irq_enabled:
+                    # Blocks until a card answers or the timeout expires
+                    tag_id = self.rfid_reader.wait_for_tag(timeout_ms)
+                else:
+                    if stop_event.wait(scan_interval):
+                        break
+                    tag_id = self.rfid_reader.read_tag()
+                    
+                if tag_id and not self.is_test_mode:
+                    Clock.schedule_once(lambda dt, t=tag_id: self.handle_tag_detection(t))
+                    
+            except Exception as e:
+                logger.error("RFID scanning error: %s", e)
 
     def handle_tag_detection(self, tag_id):
         """Handle RFID tag detection and video loading."""
         try:
             # Find matching video in configuration
-            for tag in self.config['rfid_tags']:
-                if tag['tag_id'] == tag_id:
-                    self.load_video(tag['video_path'])
-                    return
-            
+            video_path = self._tag_map.get(tag_id)
+            if video_path:
+                self.load_video(video_path)
+                
             # If no match found and no video is playing
-            if not self.current_video:
+            elif not self.current_video:
                 self.show_message("Unidentified Tag Detected")
                 
         except Exception as e:
-            logger.error(f"Error handling tag detection: {e}")
+            logger.error("Error handling tag detection: %s", e)
 
     def load_video(self, video_path):
         """Load and prepare video for playback."""
         try:
             if os.path.exists(video_path):
-                self.video_player.load(video_path)
-                self.current_video = video_path
-                self.show_message("Video Loaded - Press Play")
+                self.show_message("Loading Video...")
                 
-                # Schedule progress updates
-                Clock.schedule_interval(self.update_progress, 0.1)
+                # Load off the UI thread, results come back through the Clock
+                self.video_player.load_async(
+                    video_path,
+                    lambda: Clock.schedule_once(lambda dt: self._on_video_ready(video_path)),
+                    lambda e: Clock.schedule_once(lambda dt: self._on_video_error(e))
+                )
             else:
                 self.show_message(f"File not found: {video_path}")
-                logger.error(f"Video file not found: {video_path}")
+                logger.error("Video file not found: %s", video_path)
         except Exception as e:
-            self.show_message(f"Error loading video: {str(e)}")
-            logger.error(f"Error loading video: {e}")
+            self._on_video_error(e)
+
+    def _on_video_ready(self, video_path):
+        """Handle a video that finished loading and shows its first frame."""
+        self.current_video = video_path
+        self.show_message("Video Loaded - Press Play")
+        
+        # Pipeline is prerolled, so the duration is normally known
+        self._duration = self.video_player.get_duration()
+
+    def _get_duration(self):
+        """
+        Return the cached duration, querying the player again while it is unknown.
+        
+        Returns:
+            float: Duration in seconds, 0 if still unknown
+        """
+        if self._duration <= 0:
+            self._duration = self.video_player.get_duration()
+        return self._duration
+
+    def _on_video_error(self, error):
+        """Handle a video that failed to load."""
+        self.show_message(f"Error loading video: {str(error)}")
+        logger.error("Error loading video: %s", error)
 
     def check_battery(self, dt):
         """Check battery level and handle low battery conditions."""
         try:
             battery_level = self.battery_monitor.get_level()
             
-            if battery_level <= self.config['player_settings']['critical_battery_threshold']:
+            if battery_level <= self._crit:
                 self.handle_critical_battery()
-            elif battery_level <= self.config['player_settings']['low_battery_threshold']:
+            elif battery_level <= self._low:
                 self.show_message(f"Low Battery: {battery_level}%")
                 
         except Exception as e:
-            logger.error(f"Battery monitoring error: {e}")
+            logger.error("Battery monitoring error: %s", e)
 
     def handle_critical_battery(self):
         """Handle critical battery level situation."""
         self.show_message("Critical Battery Level - Shutting Down in 5 seconds")
-        time.sleep(5)  # Give user time to see the message
-        self.shutdown_system()
+        # Give user time to see the message without blocking the UI thread
+        Clock.schedule_once(lambda dt: self.shutdown_system(), 5)
 
     def shutdown_system(self):
         """Perform system shutdown."""
         try:
             # Save current state if needed
             if self.current_video:
-                self.video_player.save_state()
+                self.video_player.save_state(force=True)
             
             # Perform system shutdown
-            os.system('sudo shutdown -h now')
+            subprocess.Popen(SHUTDOWN_COMMAND, close_fds=True)
         except Exception as e:
-            logger.error(f"Shutdown error: {e}")
+            logger.error("Shutdown error: %s", e)
 
     def on_touch_down(self, window, touch):
         """Handle touch down events for controls."""
@@ -239,14 +354,14 @@ class MediaPlayerApp(App):
         self.show_controls()
         
         # Get touch position relative to window width
-        touch_x = touch.x / Window.width
+        touch_x = touch.x * self._win_width_inv
         
         if touch_x < 0.33:  # Left third
             self.video_player.seek(self.video_player.get_position() - 10)
         elif touch_x > 0.66:  # Right third
             self.video_player.seek(self.video_player.get_position() + 10)
         else:  # Middle third
-            if self.video_player.player.is_playing():
+            if self.video_player.is_playing:
                 self.video_player.pause()
                 self.status_label.text = "Paused"
             else:
@@ -261,16 +376,20 @@ class MediaPlayerApp(App):
         # Check if touch was on progress bar
         if touch.y < self.progress_bar.height:
             # Calculate position based on touch x
-            position = (touch.x / Window.width) * self.video_player.get_duration()
+            position = touch.x * self._win_width_inv * self._get_duration()
             self.video_player.seek(position)
             
+    def on_window_resize(self, window, width, height):
+        """Update cached window width used to scale touch positions."""
+        self._win_width_inv = 1.0 / width
+            
     def on_progress_change(self, instance, value):
         """Handle progress bar value changes."""
-        if not self.current_video:
+        if not self.current_video or self._progress_from_player:
             return
             
         # Update video position
-        position = (value / 100) * self.video_player.get_duration()
+        position = value * 0.01 * self._get_duration()
         self.video_player.seek(position)
         
     def show_controls(self):
@@ -281,18 +400,21 @@ class MediaPlayerApp(App):
         
     def hide_controls(self):
         """Hide controls overlay."""
-        if self.controls_visible and not self.video_player.player.is_playing():
+        if self.controls_visible and not self.video_player.is_playing:
             self.controls_visible = False
             self.controls_overlay.opacity = 0
             
     def update_progress(self, dt):
-        """Update progress bar and handle controls visibility."""
+        """Update playback progress and handle controls visibility."""
         if self.current_video:
-            # Update progress bar
-            position = self.video_player.get_position()
-            duration = self.video_player.get_duration()
-            if duration > 0:
-                self.progress_bar.value = (position / duration) * 100
+            # Position moves while playing, and on seeks while the bar is shown
+            if (self.video_player.is_playing or self.controls_visible) and self._get_duration() > 0:
+                position = self.video_player.get_position()
+                
+                # Progress bar follows via binding; don't seek back to it
+                self._progress_from_player = True
+                self.progress = (position / self._duration) * 100
+                self._progress_from_player = False
                 
             # Handle controls visibility
             if self.controls_visible and time.time() - self.last_touch_time > self.controls_timeout:
@@ -303,6 +425,20 @@ class MediaPlayerApp(App):
         self.status_label.text = message
         self.show_controls()
 
+    def on_stop(self):
+        """Release hardware resources owned by the components."""
+        # The scan thread uses the reader; stop it before the reader is released
+        self.rfid_stop_event.set()
+        if self.rfid_thread:
+            self.rfid_thread.join()
+            
+        for component in (self.video_player, self.button_controller,
+                          self.rfid_reader, self.battery_monitor):
+            if component:
+                component.cleanup()
+                
+        cleanup_pins([self.power_button_pin])
+
     def on_keyboard(self, window, key, *args):
         """Handle keyboard events."""
         if key == 301:  # F10 key
@@ -318,39 +454,15 @@ class MediaPlayerApp(App):
         else:
             self.show_message("Test video not found")
 
-    def optimize_resources(self):
-        """Optimize system resource usage."""
-        try:
-            # Reduce CPU usage when idle
-            if not self.current_video:
-                # Lower process priority
-                os.nice(10)  # Lower priority
-                
-                # Reduce update frequency
-                Clock.unschedule(self.update_progress)
-                
-            else:
-                # Restore normal priority
-                os.nice(0)
-                
-                # Restore update frequency
-                Clock.schedule_interval(self.update_progress, 0.1)
-                
-            logger.info("Resource optimization completed")
-            
-        except Exception as e:
-            logger.error(f"Error optimizing resources: {e}")
-            
     def handle_system_events(self):
         """Handle system events like power button presses."""
         try:
             # Monitor power button GPIO pin
-            power_button_pin = 3  # GPIO pin for power button
-            GPIO.setup(power_button_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            setup_input(self.power_button_pin, GPIO.PUD_UP)
             
             # Add event detection for power button
             GPIO.add_event_detect(
-                power_button_pin,
+                self.power_button_pin,
                 GPIO.FALLING,
                 callback=self._power_button_callback,
                 bouncetime=300
@@ -359,18 +471,21 @@ class MediaPlayerApp(App):
             logger.info("System event handlers initialized")
             
         except Exception as e:
-            logger.error(f"Error setting up system event handlers: {e}")
+            logger.error("Error setting up system event handlers: %s", e)
             
     def _power_button_callback(self, channel):
         """Handle power button press."""
         try:
-            # Start shutdown sequence
-            self.show_message("Shutting Down...")
-            time.sleep(2)
-            self.shutdown_system()
+            # Runs on the GPIO thread; hand the shutdown sequence to the UI loop
+            Clock.schedule_once(lambda dt: self._start_power_button_shutdown())
             
         except Exception as e:
-            logger.error(f"Error handling power button press: {e}")
+            logger.error("Error handling power button press: %s", e)
+            
+    def _start_power_button_shutdown(self):
+        """Show the shutdown message and shut down once it has been visible."""
+        self.show_message("Shutting Down...")
+        Clock.schedule_once(lambda dt: self.shutdown_system(), 2)
 
 if __name__ == '__main__':
     MediaPlayerApp().run() 
\ No newline at end of file
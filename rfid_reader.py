@@ -6,11 +6,40 @@ Handles communication with the MFRC-522 RC522 RFID reader.
 
 import logging
 import time
-import RPi.GPIO as GPIO
-from mfrc522 import SimpleMFRC522
+from datetime import timedelta
+import gpiod
+from gpiod.line import Bias, Direction, Edge
+from mfrc522 import MFRC522, SimpleMFRC522
+
+from gpio_manager import GPIO_CHIP, ensure_mode
 
 logger = logging.getLogger(__name__)
 
+# BCM pin wired to the MFRC522 RST line
+RST_PIN = 25
+
+# MFRC522 interrupt configuration: IRQ pin active low, only RxIRq enabled
+COM_IEN_RX_IRQ = 0xA0
+DIV_IEN_PUSH_PULL = 0x80
+
+# Clears every bit in ComIrqReg
+COM_IRQ_CLEAR = 0x7F
+
+# BitFramingReg value for a 7-bit short frame with StartSend set
+BIT_FRAMING_REQA = 0x87
+
+# A tag seen again within this window is the same plate still on the reader.
+# A resting card only answers every other REQA, so the window also spans
+# TAG_COOLDOWN_SCANS scan intervals
+TAG_COOLDOWN_NS = 3_000_000_000
+TAG_COOLDOWN_SCANS = 3
+
+class _BCMSimpleMFRC522(SimpleMFRC522):
+    """SimpleMFRC522 with an explicit reset pin; its BCM default is not GPIO 25."""
+    
+    def __init__(self, pin_rst):
+        self.READER = MFRC522(pin_rst=pin_rst)
+        
 class RFIDReader:
     """
     Class for handling RFID reader operations.
@@ -27,20 +56,61 @@ class RFIDReader:
         self.config = config
         self.reader = None
         self.is_connected = False
-        self.last_read_time = 0
-        self.last_tag_id = None
+        self._last_uid_int = 0
+        self._last_uid_ns = 0
+        scan_interval_ns = int(config['player_settings']['scan_interval'] * 1_000_000_000)
+        self._cooldown_ns = max(TAG_COOLDOWN_NS, TAG_COOLDOWN_SCANS * scan_interval_ns)
+        self.irq_request = None
+        self.irq_enabled = False
         self.initialize_reader()
         
     def initialize_reader(self):
         """Initialize the RFID reader with error handling."""
         try:
-            self.reader = SimpleMFRC522()
+            # Select BCM first; mfrc522 falls back to BOARD when no mode is set
+            # and picks its reset pin from the mode
+            ensure_mode()
+            self.reader = _BCMSimpleMFRC522(RST_PIN)
             self.is_connected = True
             logger.info("RFID reader initialized successfully")
         except Exception as e:
             self.is_connected = False
-            logger.warning(f"RFID reader initialization failed: {e}")
+            self.irq_enabled = False
+            logger.warning("RFID reader initialization failed: %s", e)
             logger.info("Running in fallback mode - RFID reader not available")
+            return
+            
+        self.initialize_irq()
+        
+    def initialize_irq(self):
+        """Route RxIRq to the MFRC522 IRQ pin and watch it for falling edges."""
+        irq_pin = self.config.get('rfid_reader', {}).get('irq_pin')
+        if irq_pin is None:
+            logger.info("No RFID IRQ pin configured - polling for tags")
+            return
+            
+        try:
+            mfrc = self.reader.READER
+            mfrc.Write_MFRC522(mfrc.CommIEnReg, COM_IEN_RX_IRQ)
+            mfrc.Write_MFRC522(mfrc.DivlEnReg, DIV_IEN_PUSH_PULL)
+            
+            if self.irq_request is None:
+                self.irq_request = gpiod.request_lines(
+                    GPIO_CHIP,
+                    consumer='media_player_rfid',
+                    config={irq_pin: gpiod.LineSettings(
+                        direction=Direction.INPUT,
+                        bias=Bias.PULL_UP,
+                        edge_detection=Edge.FALLING
+                    )}
+                )
+                
+            self.irq_enabled = True
+            logger.info("RFID IRQ enabled on GPIO %s", irq_pin)
+            
+        except Exception as e:
+            self.irq_enabled = False
+            logger.warning("RFID IRQ setup failed, polling for tags: %s", e)
             
     def read_tag(self):
         """
@@ -53,40 +123,102 @@ class RFIDReader:
             return None
             
         try:
-            # Implement debouncing to prevent rapid re-reads
-            current_time = time.time()
-            if current_time - self.last_read_time < 1.0:  # 1 second debounce
+            # Only the UID is needed, skip reading the data blocks
+            uid = self.reader.read_id_no_block()
+            
+            if uid is not None:
+                return self._new_tag_id(uid)
+                
+            return None
+            
+        except Exception as e:
+            logger.error("Error reading RFID tag: %s", e)
+            # Attempt to reinitialize reader on error
+            self.initialize_reader()
+            return None
+            
+    def wait_for_tag(self, timeout_ms):
+        """
+        Send one REQA and block until the reader raises its IRQ or the timeout expires.
+        Only a card answering the request triggers the anticollision read.
+        
+        Args:
+            timeout_ms (int): Maximum time to wait for a card in milliseconds
+            
+        Returns:
+            str: Tag ID if a new tag was detected, None otherwise
+        """
+        if not self.irq_enabled:
+            return None
+            
+        try:
+            mfrc = self.reader.READER
+            
+            # Anticollision routes extra interrupts to the pin; drop their queued edges
+            while self.irq_request.wait_edge_events(0):
+                self.irq_request.read_edge_events()
+                
+            # Arm the reader: clear pending IRQs and transmit REQA
+            mfrc.Write_MFRC522(mfrc.CommIrqReg, COM_IRQ_CLEAR)
+            mfrc.Write_MFRC522(mfrc.FIFOLevelReg, 0x80)
+            mfrc.Write_MFRC522(mfrc.FIFODataReg, mfrc.PICC_REQIDL)
+            mfrc.Write_MFRC522(mfrc.CommandReg, mfrc.PCD_TRANSCEIVE)
+            mfrc.Write_MFRC522(mfrc.BitFramingReg, BIT_FRAMING_REQA)
+            
+            if not self.irq_request.wait_edge_events(timedelta(milliseconds=timeout_ms)):
+                mfrc.Write_MFRC522(mfrc.CommandReg, mfrc.PCD_IDLE)
                 return None
                 
-            id, text = self.reader.read_no_block()
+            self.irq_request.read_edge_events()
+            mfrc.Write_MFRC522(mfrc.CommandReg, mfrc.PCD_IDLE)
+            mfrc.Write_MFRC522(mfrc.CommIrqReg, COM_IRQ_CLEAR)
+            
+            status, uid = mfrc.MFRC522_Anticoll()
+            
+            # Anticollision reprograms ComIEnReg, restore the RxIRq routing
+            mfrc.Write_MFRC522(mfrc.CommIEnReg, COM_IEN_RX_IRQ)
             
-            if id is not None:
-                self.last_read_time = current_time
-                tag_id = str(id)
+            if status != mfrc.MI_OK:
+                return None
                 
-                # Only return new tag IDs to prevent duplicate reads
-                if tag_id != self.last_tag_id:
-                    self.last_tag_id = tag_id
-                    logger.info(f"RFID tag detected: {tag_id}")
-                    return tag_id
-                    
-            return None
+            return self._new_tag_id(self.reader.uid_to_num(uid))
             
         except Exception as e:
-            logger.error(f"Error reading RFID tag: {e}")
+            logger.error("Error waiting for RFID tag: %s", e)
             # Attempt to reinitialize reader on error
             self.initialize_reader()
             return None
             
+    def _new_tag_id(self, uid):
+        """
+        Filter out repeated reads of the tag that is already on the reader.
+        
+        Args:
+            uid (int): Numeric UID that was read
+            
+        Returns:
+            str: Tag ID if this is a new presentation of the tag, None otherwise
+        """
+        now = time.monotonic_ns()
+        last_uid_ns = self._last_uid_ns
+        self._last_uid_ns = now
+        
+        # Same tag seen again within the cooldown is still resting on the reader
+        if uid == self._last_uid_int and now - last_uid_ns < self._cooldown_ns:
+            return None
+            
+        self._last_uid_int = uid
+        tag_id = str(uid)
+        logger.info("RFID tag detected: %s", tag_id)
+        return tag_id
+            
     def cleanup(self):
-        """Clean up GPIO resources."""
+        """Release the IRQ line."""
         try:
-            if self.is_connected:
-                GPIO.cleanup()
+            if self.irq_request:
+                self.irq_request.release()
+                self.irq_request = None
+                self.irq_enabled = False
                 logger.info("RFID reader GPIO resources cleaned up")
         except Exception as e:
-            logger.error(f"Error cleaning up RFID reader: {e}")
-            
-    def __del__(self):
-        """Destructor to ensure proper cleanup."""
-        self.cleanup() 
\ No newline at end of file
+            logger.error("Error cleaning up RFID reader: %s", e) 
\ No newline at end of file
@@ -4,17 +4,83 @@ Video Player Module
 Handles video playback with hardware acceleration and touch controls.
 """
 
+import atexit
 import logging
 import os
-import json
+import struct
 import time
+import threading
 from pathlib import Path
 import gi
 gi.require_version('Gst', '1.0')
-from gi.repository import Gst, GLib
+gi.require_version('GstAudio', '1.0')
+from gi.repository import Gst, GstAudio, GLib
 
 logger = logging.getLogger(__name__)
 
+# Hardware H.264 decoder preferred by playbin3's decodebin3
+HW_DECODER = 'v4l2h264dec'
+
+# Read size for local files; large reads let kernel readahead stream the file
+FILESRC_BLOCKSIZE = 1024 * 1024
+
+# Decoded frames reach the GL sink by DMABuf fd: no CPU colour
+# conversion and no host-to-GPU upload per frame. System-memory NV12 is
+# negotiated instead where DMABuf is unavailable; glimagesink uploads it itself
+VIDEO_SINK = (
+    'capsfilter caps="video/x-raw(memory:DMABuf),format=NV12; video/x-raw,format=NV12" ! '
+    'glimagesink name=videosink sync=false'
+)
+
+# Upper bound on the first-frame preroll; GL and V4L2 start-up on the first
+# load can take well over a second
+PREROLL_TIMEOUT = 10 * Gst.SECOND
+
+# Playback state persisted across restarts as one fixed-size record:
+# position (s), duration (s), volume, NUL-padded UTF-8 video path
+STATE_FILE = Path('playback_state.bin')
+STATE_FMT = '<ddI256s'
+STATE_SIZE = struct.calcsize(STATE_FMT)
+
+# Minimum seconds between two non-forced state saves
+STATE_SAVE_INTERVAL = 2.0
+
+# Software volume element avoids ALSA mixer writes on every change
+AUDIO_SINK = (
+    'audioconvert ! '
+    'audioresample ! '
+    'volume name=vol ! '
+    'alsasink name=audiosink'
+)
+
+def _build_pipeline():
+    """
+    Initialize GStreamer and build the playbin3 pipeline with its sink bins.
+    
+    Returns:
+        Gst.Element: playbin3 with the video and audio sinks installed
+    """
+    # DMABuf import into GL only works on EGL, not GLX
+    os.environ.setdefault('GST_GL_PLATFORM', 'egl')
+    os.environ.setdefault('GST_GL_API', 'gles2')
+    
+    # Initialize GStreamer
+    Gst.init(None)
+    
+    # Make decodebin3 pick the hardware decoder over software ones
+    decoder = Gst.ElementFactory.find(HW_DECODER)
+    if decoder:
+        decoder.set_rank(Gst.Rank.PRIMARY + 1)
+        
+    # playbin3 keeps its sinks across loads; only the URI changes
+    pipeline = Gst.ElementFactory.make('playbin3', 'player')
+    
+    # Create zero-copy video sink for hardware acceleration
+    pipeline.set_property('video-sink', Gst.parse_bin_from_description(VIDEO_SINK, True))
+    pipeline.set_property('audio-sink', Gst.parse_bin_from_description(AUDIO_SINK, True))
+    
+    return pipeline
+
 class VideoPlayer:
     """
     Class for handling video playback using GStreamer with hardware acceleration.
@@ -30,44 +96,76 @@ class VideoPlayer:
         """
         self.config = config
         self.pipeline = None
+        self._videosink = None
+        self._volume_element = None
+        self._applied_volume = None
         self.bus = None
+        self.main_loop = None
+        self._msg_handlers = {}
+        self.decoder_stats = {'frames_decoded': 0, 'frames_dropped': 0, 'bytes': 0}
+        self._stats_snapshot = (0, 0, 0)
+        self._sink_dropped = 0
+        self.on_playback_error = None
         self.current_video = None
         self.playback_position = 0
+        self._segment = None
         self.volume = config['player_settings']['default_volume']
         self.is_playing = False
+        self._last_save = 0
+        self.load_lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self._cleaned = False
         self.initialize_player()
         
+        # Safety net for callers that never reach cleanup()
+        atexit.register(self.cleanup)
+        
+    def __enter__(self):
+        """Return the player for use as a context manager."""
+        return self
+        
+    def __exit__(self, *exc):
+        """Clean up the player when leaving the context."""
+        self.cleanup()
+        
     def initialize_player(self):
         """Initialize GStreamer player with hardware acceleration."""
         try:
-            # Initialize GStreamer
-            Gst.init(None)
-            
-            # Create optimized pipeline for hardware acceleration
-            pipeline_str = (
-                f'filesrc location={{}} ! '
-                'qtdemux ! '
-                'h264parse ! '
-                'v4l2h264dec ! '
-                'videoconvert ! '
-                'video/x-raw,format=RGBA ! '
-                'glupload ! '
-                'glcolorconvert ! '
-                'glimagesink sync=false '
-                'qtdemux.audio_0 ! '
-                'aacparse ! '
-                'faad ! '
-                'audioconvert ! '
-                'audioresample ! '
-                'alsasink'
-            )
+            self.pipeline = _build_pipeline()
+            self.pipeline.connect('element-setup', self._on_element_setup)
+            self.pipeline.connect('source-setup', self._on_source_setup)
             
-            self.pipeline = Gst.parse_launch(pipeline_str)
+            # Resolve sink elements once instead of walking the bins per call
+            video_sink = self.pipeline.get_property('video-sink')
+            audio_sink = self.pipeline.get_property('audio-sink')
+            self._videosink = video_sink.get_by_name('videosink')
+            self._volume_element = audio_sink.get_by_name('vol')
+            self._applied_volume = None
             
+            # Track the position from frames reaching the sink instead of querying
+            self._videosink.get_static_pad('sink').add_probe(
+                Gst.PadProbeType.BUFFER | Gst.PadProbeType.EVENT_DOWNSTREAM,
+                self._position_probe
+            )
+            
+            # Bus messages we act on; everything else is dropped at the source
+            self._msg_handlers = {
+                Gst.MessageType.EOS: self._on_video_end,
+                Gst.MessageType.ERROR: self._on_error,
+                # Redistribute latency so sinks don't drop late buffers
+                Gst.MessageType.LATENCY: lambda message: self.pipeline.recalculate_latency()
+            }
+            if logger.isEnabledFor(logging.DEBUG):
+                self._msg_handlers[Gst.MessageType.QOS] = self._on_qos
+                GLib.timeout_add_seconds(1, self._log_decoder_stats)
+                
             # Get bus for message handling
             self.bus = self.pipeline.get_bus()
-            self.bus.add_signal_watch()
-            self.bus.connect('message', self._on_message)
+            self.bus.set_sync_handler(self._sync_handler)
+            
+            # Kivy owns the main thread, so run a GLib loop for bus dispatch
+            self.main_loop = GLib.MainLoop()
+            threading.Thread(target=self.main_loop.run, daemon=True).start()
             
             # Set initial volume
             self.set_volume(self.volume)
@@ -75,30 +173,109 @@ class VideoPlayer:
             logger.info("Video player initialized successfully")
             
         except Exception as e:
-            logger.error(f"Failed to initialize video player: {e}")
+            logger.error("Failed to initialize video player: %s", e)
             raise
             
+    def _on_element_setup(self, playbin, element):
+        """Configure elements as playbin3 creates them."""
+        factory = element.get_factory()
+        if factory and factory.get_name() == HW_DECODER:
+            # Export decoded frames as DMABuf for the GL sink
+            Gst.util_set_object_arg(element, 'capture-io-mode', 'dmabuf')
+            
+            # Count decoder output only when it will be logged
+            if logger.isEnabledFor(logging.DEBUG):
+                element.get_static_pad('src').add_probe(
+                    Gst.PadProbeType.BUFFER, self._decoder_probe
+                )
+                
+    def _decoder_probe(self, pad, info):
+        """Count frames and bytes leaving the hardware decoder."""
+        stats = self.decoder_stats
+        stats['frames_decoded'] += 1
+        stats['bytes'] += info.get_buffer().get_size()
+        return Gst.PadProbeReturn.OK
+        
+    def _log_decoder_stats(self):
+        """Log decoder throughput for the last second."""
+        if not self.pipeline:
+            return False
+            
+        stats = self.decoder_stats
+        frames, dropped, size = self._stats_snapshot
+        if stats['frames_decoded'] != frames:
+            logger.debug("Decoder: %d frames decoded, %d dropped, %d bytes/s",
+                         stats['frames_decoded'] - frames,
+                         stats['frames_dropped'] - dropped,
+                         stats['bytes'] - size)
+        self._stats_snapshot = (stats['frames_decoded'], stats['frames_dropped'], stats['bytes'])
+        return True
+            
+    def _on_source_setup(self, playbin, source):
+        """Configure the source element playbin3 creates for each URI."""
+        factory = source.get_factory()
+        if factory and factory.get_name() == 'filesrc':
+            # Default 4 KiB reads cost many syscalls per frame of bitstream
+            source.set_property('blocksize', FILESRC_BLOCKSIZE)
+            
+    def _position_probe(self, pad, info):
+        """Update the cached playback position from each frame's timestamp."""
+        if info.type & Gst.PadProbeType.BUFFER:
+            pts = info.get_buffer().pts
+            if pts != Gst.CLOCK_TIME_NONE and self._segment:
+                stream_time = self._segment.to_stream_time(Gst.Format.TIME, pts)
+                if stream_time != Gst.CLOCK_TIME_NONE:
+                    self.playback_position = stream_time / Gst.SECOND
+        else:
+            # Keep the segment to map buffer timestamps to stream time
+            event = info.get_event()
+            if event.type == Gst.EventType.SEGMENT:
+                self._segment = event.parse_segment()
+                
+        return Gst.PadProbeReturn.OK
+        
+    def _sync_handler(self, bus, message):
+        """Filter bus messages on the posting thread and queue the relevant ones."""
+        if message.type in self._msg_handlers:
+            GLib.idle_add(self._on_message, bus, message)
+        return Gst.BusSyncReply.DROP
+        
     def _on_message(self, bus, message):
-        """Handle GStreamer bus messages."""
-        try:
-            if message.type == Gst.MessageType.EOS:
-                self._on_video_end()
-            elif message.type == Gst.MessageType.ERROR:
-                err, debug = message.parse_error()
-                logger.error(f"GStreamer error: {err.message}")
-                self.show_message(f"Playback Error: {err.message}")
-        except Exception as e:
-            logger.error(f"Error handling GStreamer message: {e}")
+        """Dispatch a GStreamer bus message to its handler."""
+        handler = self._msg_handlers.get(message.type)
+        if handler:
+            handler(message)
             
-    def _on_video_end(self):
+        return False  # One-shot idle callback
+        
+    def _on_error(self, message):
+        """Handle a pipeline error message."""
+        err, debug = message.parse_error()
+        logger.error("GStreamer error: %s", err.message)
+        if self.on_playback_error:
+            self.on_playback_error(f"Playback Error: {err.message}")
+            
+    def _on_qos(self, message):
+        """Log frame drop statistics from a QoS message."""
+        fmt, processed, dropped = message.parse_qos_stats()
+        # QoS comes from the base sink inside the glimagesink bin
+        if message.src.has_as_ancestor(self._videosink):
+            # The sink's count restarts on flushing seeks; keep ours cumulative
+            last = self._sink_dropped
+            self.decoder_stats['frames_dropped'] += dropped - last if dropped >= last else dropped
+            self._sink_dropped = dropped
+        logger.debug("QoS from %s: %s processed, %s dropped",
+                     message.src.get_name(), processed, dropped)
+                     
+    def _on_video_end(self, message=None):
         """Handle video end event."""
         try:
-            # Reset to first frame
+            # Reset to first frame; pausing also persists the state
             self.seek(0)
             self.pause()
             logger.info("Video ended, reset to first frame")
         except Exception as e:
-            logger.error(f"Error handling video end: {e}")
+            logger.error("Error handling video end: %s", e)
             
     def load(self, video_path):
         """
@@ -111,31 +288,65 @@ class VideoPlayer:
             if not os.path.exists(video_path):
                 raise FileNotFoundError(f"Video file not found: {video_path}")
                 
-            # Stop current playback if any
-            if self.pipeline:
-                self.pipeline.set_state(Gst.State.NULL)
+            # Same file retapped: it is already prerolled, just rewind
+            result, state, pending = self.pipeline.get_state(0)
+            if video_path == self.current_video and state >= Gst.State.PAUSED:
+                self.seek(0)
+                self.pause()
+                logger.info("Video reloaded: %s", video_path)
+                return
                 
-            # Set new file source
-            filesrc = self.pipeline.get_by_name('filesrc0')
-            filesrc.set_property('location', video_path)
+            # Back to READY to change the URI; sinks stay open between loads
+            self.pipeline.set_state(Gst.State.READY)
+            self.pipeline.set_property('uri', Gst.filename_to_uri(video_path))
             
             # Store current video path
             self.current_video = video_path
+            self.playback_position = 0
             
-            # Load saved position if exists
-            self.load_saved_position()
+            # PAUSED prerolls the first frame; get_state returns as soon as that completes.
+            # ASYNC means it is still prerolling, and a seek now would be lost
+            self.pipeline.set_state(Gst.State.PAUSED)
+            result, state, pending = self.pipeline.get_state(PREROLL_TIMEOUT)
+            if result == Gst.StateChangeReturn.FAILURE:
+                raise RuntimeError(f"Failed to preroll video: {video_path}")
+            if result == Gst.StateChangeReturn.ASYNC:
+                raise TimeoutError(f"Timed out prerolling video: {video_path}")
+            self.is_playing = False
             
-            # Pause on first frame
-            self.play()  # Start playback to get first frame
-            time.sleep(0.1)  # Wait for first frame
-            self.pause()  # Pause on first frame
+            # Load saved position if exists; seeking needs a prerolled pipeline
+            self.load_saved_position()
             
-            logger.info(f"Video loaded: {video_path}")
+            logger.info("Video loaded: %s", video_path)
             
         except Exception as e:
-            logger.error(f"Error loading video: {e}")
+            logger.error("Error loading video: %s", e)
             raise
             
+    def load_async(self, video_path, on_ready, on_error=None):
+        """
+        Load a video file on a worker thread.
+        Callbacks run on the worker thread; callers marshal them to their UI thread.
+        
+        Args:
+            video_path (str): Path to the video file
+            on_ready (function): Called without arguments once the first frame is ready
+            on_error (function): Called with the exception if loading fails
+        """
+        def worker():
+            try:
+                # Serialize loads when plates are swapped quickly
+                with self.load_lock:
+                    self.load(video_path)
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                return
+                
+            on_ready()
+            
+        threading.Thread(target=worker, daemon=True).start()
+        
     def play(self):
         """Start or resume video playback."""
         try:
@@ -144,7 +355,7 @@ class VideoPlayer:
                 self.is_playing = True
                 logger.info("Video playback started")
         except Exception as e:
-            logger.error(f"Error starting playback: {e}")
+            logger.error("Error starting playback: %s", e)
             
     def pause(self):
         """Pause video playback."""
@@ -153,8 +364,9 @@ class VideoPlayer:
                 self.pipeline.set_state(Gst.State.PAUSED)
                 self.is_playing = False
                 logger.info("Video playback paused")
+                self.save_state()
         except Exception as e:
-            logger.error(f"Error pausing playback: {e}")
+            logger.error("Error pausing playback: %s", e)
             
     def stop(self):
         """Stop video playback."""
@@ -164,7 +376,7 @@ class VideoPlayer:
                 self.is_playing = False
                 logger.info("Video playback stopped")
         except Exception as e:
-            logger.error(f"Error stopping playback: {e}")
+            logger.error("Error stopping playback: %s", e)
             
     def seek(self, position):
         """
@@ -177,14 +389,18 @@ class VideoPlayer:
             if self.pipeline:
                 # Convert to nanoseconds
                 seek_time = position * Gst.SECOND
-                self.pipeline.seek_simple(
+                if self.pipeline.seek_simple(
                     Gst.Format.TIME,
-                    Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT,
+                    # Snap to the nearest keyframe instead of decoding a whole GOP forward
+                    Gst.SeekFlags.FLUSH | Gst.SeekFlags.KEY_UNIT | Gst.SeekFlags.SNAP_NEAREST,
                     seek_time
-                )
-                logger.info(f"Seeked to position: {position}s")
+                ):
+                    # The probe only updates on the next frame; don't let a save
+                    # before then record the pre-seek position
+                    self.playback_position = position
+                logger.info("Seeked to position: %ss", position)
         except Exception as e:
-            logger.error(f"Error seeking video: {e}")
+            logger.error("Error seeking video: %s", e)
             
     def set_volume(self, volume):
         """
@@ -195,31 +411,31 @@ class VideoPlayer:
         """
         try:
             if self.pipeline:
-                self.volume = max(0, min(100, volume))
-                # Convert to linear volume (0.0 to 1.0)
-                linear_volume = self.volume / 100.0
-                alsasink = self.pipeline.get_by_name('alsasink0')
-                alsasink.set_property('volume', linear_volume)
-                logger.info(f"Volume set to: {volume}")
+                volume = 0 if volume < 0 else 100 if volume > 100 else volume
+                if volume == self._applied_volume:
+                    return
+                self.volume = volume
+                # Map the cubic (perceptual) level to the linear gain
+                linear_volume = GstAudio.StreamVolume.convert_volume(
+                    GstAudio.StreamVolumeFormat.CUBIC,
+                    GstAudio.StreamVolumeFormat.LINEAR,
+                    volume * 0.01
+                )
+                self._volume_element.set_property('volume', linear_volume)
+                self._applied_volume = volume
+                logger.info("Volume set to: %s", volume)
         except Exception as e:
-            logger.error(f"Error setting volume: {e}")
+            logger.error("Error setting volume: %s", e)
             
     def get_position(self):
         """
         Get current playback position.
+        Updated by a probe on the video sink as frames are rendered.
         
         Returns:
             float: Current position in seconds
         """
-        try:
-            if self.pipeline:
-                success, position = self.pipeline.query_position(Gst.Format.TIME)
-                if success:
-                    return position / Gst.SECOND
-            return 0
-        except Exception as e:
-            logger.error(f"Error getting position: {e}")
-            return 0
+        return self.playback_position
             
     def get_duration(self):
         """
@@ -235,58 +451,92 @@ class VideoPlayer:
                     return duration / Gst.SECOND
             return 0
         except Exception as e:
-            logger.error(f"Error getting duration: {e}")
+            logger.error("Error getting duration: %s", e)
             return 0
             
-    def save_state(self):
-        """Save current playback state."""
+    def save_state(self, force=False):
+        """
+        Save current playback state.
+        
+        Args:
+            force (bool): Save even if the last save was less than STATE_SAVE_INTERVAL ago
+        """
         try:
             if self.current_video:
-                state = {
-                    'video_path': self.current_video,
-                    'position': self.get_position(),
-                    'volume': self.volume
-                }
-                
-                # Save to state file
-                state_file = Path('playback_state.json')
-                with open(state_file, 'w') as f:
-                    json.dump(state, f)
+                now = time.monotonic()
+                if not force and now - self._last_save < STATE_SAVE_INTERVAL:
+                    return
                     
+                record = struct.pack(
+                    STATE_FMT,
+                    self.get_position(),
+                    self.get_duration(),
+                    int(self.volume),
+                    self.current_video.encode()
+                )
+                
+                # Write a temporary file, flush it to the card and swap it in, so a
+                # power loss never leaves a truncated state file behind. Saves come
+                # from the UI and GLib threads and share the temporary file name
+                tmp_file = STATE_FILE.with_name(STATE_FILE.name + '.tmp')
+                with self.save_lock:
+                    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                    try:
+                        os.write(fd, record)
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                    os.replace(tmp_file, STATE_FILE)
+                
+                self._last_save = now
                 logger.info("Playback state saved")
                 
         except Exception as e:
-            logger.error(f"Error saving playback state: {e}")
+            logger.error("Error saving playback state: %s", e)
             
     def load_saved_position(self):
         """Load saved playback position if available."""
         try:
-            state_file = Path('playback_state.json')
-            if state_file.exists():
-                with open(state_file, 'r') as f:
-                    state = json.load(f)
+            if STATE_FILE.exists():
+                record = STATE_FILE.read_bytes()
+                if len(record) != STATE_SIZE:
+                    return
                     
-                if state['video_path'] == self.current_video:
-                    self.seek(state['position'])
-                    self.set_volume(state['volume'])
+                position, saved_duration, volume, path_bytes = struct.unpack(STATE_FMT, record)
+                
+                # struct.pack truncated the path to the field size, compare the same way
+                if path_bytes == struct.pack('256s', self.current_video.encode()):
+                    # File changed length (e.g. re-encoded): resume at the same fraction
+                    duration = self.get_duration()
+                    if saved_duration > 0 and duration > 0 and duration != saved_duration:
+                        position *= duration / saved_duration
+                        
+                    self.seek(position)
+                    self.set_volume(volume)
                     logger.info("Saved playback state loaded")
                     
         except Exception as e:
-            logger.error(f"Error loading saved position: {e}")
+            logger.error("Error loading saved position: %s", e)
             
     def cleanup(self):
-        """Clean up player resources."""
+        """Clean up player resources. Safe to call more than once."""
+        if self._cleaned:
+            return
+        self._cleaned = True
+        
         try:
             if self.pipeline:
-                self.save_state()
+                self.save_state(force=True)
                 self.pipeline.set_state(Gst.State.NULL)
                 self.pipeline = None
+                self._videosink = None
+                self._volume_element = None
+                
+            if self.main_loop:
+                self.main_loop.quit()
+                self.main_loop = None
                 
             logger.info("Video player resources cleaned up")
             
         except Exception as e:
-            logger.error(f"Error cleaning up video player: {e}")
-            
-    def __del__(self):
-        """Destructor to ensure proper cleanup."""
-        self.cleanup() 
\ No newline at end of file
+            logger.error("Error cleaning up video player: %s", e) 
\ No newline at end of file